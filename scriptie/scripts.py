@@ -2,12 +2,14 @@
 Logic for enumerating and running scripts.
 """
 
-from typing import NamedTuple, Any, cast
+from typing import NamedTuple, Any, BinaryIO, cast
 from collections.abc import Iterable, Callable
 from dataclasses import dataclass, field
 
 import asyncio
 
+import bisect
+
 from pathlib import Path
 
 from enum import Enum
@@ -80,6 +82,9 @@ SCRIPTIE_MULTILINE_DECLARATION_RE = re.compile(
 # Regex matching a single line declaration
 SCRIPTIE_DECLARATION_RE = re.compile(r"^\s*## ([a-zA-Z0-9_-]+)\s*:\s*(.*)$")
 
+# Maximum number of bytes to read from a script's stdout/stderr at once
+STREAM_READ_SIZE = 64 * 1024
+
 
 def _extract_declarations(file_contents: str) -> dict[str, list[str]]:
     """Extract declarations from a file."""
@@ -141,24 +146,30 @@ def enumerate_scripts(script_dir: Path) -> Iterable[Script]:
     """
     for file in script_dir.iterdir():
         if file.is_file() and os.access(file, mode=os.X_OK):
-            declarations = _extract_declarations(file.read_text())
+            yield read_script(file)
 
-            name = declarations.get("name", [file.name.rsplit(".", maxsplit=1)[0]])[0]
 
-            description: str | None = None
-            if "description" in declarations:
-                description = "\n".join(declarations["description"])
+def read_script(file: Path) -> Script:
+    """
+    Read the declarations in a single script file. See
+    :py:func:`enumerate_scripts` for details of the declarations understood.
+    """
+    declarations = _extract_declarations(file.read_text())
 
-            args = [
-                _parse_argument(arg_spec) for arg_spec in declarations.get("arg", [])
-            ]
+    name = declarations.get("name", [file.name.rsplit(".", maxsplit=1)[0]])[0]
 
-            yield Script(
-                executable=file,
-                name=name,
-                description=description,
-                args=args,
-            )
+    description: str | None = None
+    if "description" in declarations:
+        description = "\n".join(declarations["description"])
+
+    args = [_parse_argument(arg_spec) for arg_spec in declarations.get("arg", [])]
+
+    return Script(
+        executable=file,
+        name=name,
+        description=description,
+        args=args,
+    )
 
 
 class RunningScript:
@@ -172,7 +183,17 @@ class RunningScript:
     start_time: datetime.datetime
     end_time: datetime.datetime | None
 
-    output: str
+    # Output so far as a list of chunks (lines) to be joined on demand,
+    # avoiding quadratic string concatenation. See the output property.
+    _output_chunks: list[str]
+    # The offset (in characters) at which each chunk in _output_chunks
+    # starts, allowing get_output to find (and join) just the chunks after a
+    # given offset.
+    _output_offsets: list[int]
+    _output_length: int
+    # If not None, a file to which the output is also written (as raw bytes) as
+    # it arrives.
+    output_file: Path | None
     status: str
     progress: tuple[float, float]
 
@@ -181,11 +202,22 @@ class RunningScript:
     # been registered.
     return_code: int | None
 
+    # Temporary directories associated with this script (e.g. holding its
+    # working directory or arguments) for the user of this object to delete
+    # when no longer needed. Not used by RunningScript itself.
+    temp_dirs: list[str]
+
+    # Incremented whenever status, progress, return_code or end_time change
+    # (but not output) allowing cheap detection of changes to these values.
+    state_version: int
+
     # Called (and the list emptied) whenever one of the above changes
     _on_change: list[Callable[[], None]]
 
     _subprocess: asyncio.subprocess.Process | None
 
+    _output_file_handle: BinaryIO | None
+
     _run_task: asyncio.Task
     _stdout_task: asyncio.Task | None
     _stderr_task: asyncio.Task | None
@@ -195,6 +227,7 @@ class RunningScript:
         script: Script,
         args: list[str] = [],
         working_directory: Path | None = None,
+        output_file: Path | None = None,
     ) -> None:
         self.script = script
         self.args = args
@@ -203,31 +236,54 @@ class RunningScript:
         self.start_time = datetime.datetime.now()
         self.end_time = None
 
-        self.output = ""
+        self._output_chunks = []
+        self._output_offsets = []
+        self._output_length = 0
+        self.output_file = output_file
         self.status = ""
         self.progress = (0.0, 0.0)
         self.return_code = None
+        self.state_version = 0
+
+        self.temp_dirs = []
 
         self._on_change = []
 
         self._subprocess = None
 
+        # NB: Created immediately (and flushed after every write, see
+        # _write_output_file) so that the file always holds exactly the output
+        # received so far.
+        self._output_file_handle = None
+        if self.output_file is not None:
+            self._output_file_handle = self.output_file.open("wb")
+
         self._run_task = asyncio.create_task(self._run(), name="run_task")
         self._stdout_task = None
         self._stderr_task = None
 
     async def _run(self) -> None:
-        self._subprocess = await asyncio.create_subprocess_exec(
-            str(self.script.executable),
-            *self.args,
-            cwd=str(self.working_directory),
-            stdout=PIPE,
-            stderr=PIPE,
-            bufsize=0,
-            # Launch the script in a new process group to make it possible to
-            # kill the whole subprocess and any children by group.
-            preexec_fn=os.setsid,
-        )
+        try:
+            self._subprocess = await asyncio.create_subprocess_exec(
+                str(self.script.executable),
+                *self.args,
+                cwd=str(self.working_directory),
+                stdout=PIPE,
+                stderr=PIPE,
+                bufsize=0,
+                # Launch the script in a new session (and therefore process
+                # group, whose ID is the script's PID) to make it possible to
+                # kill the whole subprocess and any children by group. NB:
+                # Unlike preexec_fn, this doesn't prevent the use of a fast
+                # posix_spawn or vfork based process launch.
+                start_new_session=True,
+            )
+        except BaseException:
+            # The stdout reader (which would otherwise close the output file)
+            # will never be started
+            if self._output_file_handle is not None:
+                self._output_file_handle.close()
+            raise
         assert self._subprocess.stdout is not None
         assert self._subprocess.stderr is not None
         self._stdout_task = asyncio.create_task(
@@ -239,6 +295,14 @@ class RunningScript:
             name="stderr_task",
         )
 
+    @property
+    def output(self) -> str:
+        """All output (interleaved stdout/stderr) produced so far."""
+        if len(self._output_chunks) > 1:
+            self._output_chunks = ["".join(self._output_chunks)]
+            self._output_offsets = [0]
+        return self._output_chunks[0] if self._output_chunks else ""
+
     def _report_change(self) -> None:
         """Trigger all current on change callbacks."""
         callbacks = self._on_change
@@ -246,18 +310,37 @@ class RunningScript:
         for callback in callbacks:
             callback()
 
-    async def _read_stream(self, stream: asyncio.StreamReader) -> None:
+    def _write_output_file(self, data: bytes) -> None:
         """
-        Read the a stdout/stderr stream, parsing out all scriptie progress and
-        status directives which appear.
+        Append to the output file (which must be open). Blocks until all of
+        the data has been written.
         """
-        try:
-            while line_bytes := await stream.readline():
-                line = line_bytes.decode("utf-8")
+        assert self._output_file_handle is not None
+        self._output_file_handle.write(data)
+        self._output_file_handle.flush()
+
+    async def _process_output(self, data: bytes) -> None:
+        """
+        Record a chunk of output (consisting of whole lines, except at the
+        end of a stream) and act on any scriptie progress and status
+        directives it contains.
+        """
+        text = data.decode("utf-8")
+
+        # NB: Written in the executor to avoid blocking the event loop
+        if self._output_file_handle is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write_output_file, data
+            )
 
-                self.output += line
+        self._output_chunks.append(text)
+        self._output_offsets.append(self._output_length)
+        self._output_length += len(text)
 
-                # Find progress/status declarations
+        # Find progress/status declarations (skipping the per-line search
+        # entirely in the common case where there are none)
+        if "##" in text:
+            for line in text.split("\n"):
                 if match := SCRIPTIE_DECLARATION_RE.match(line):
                     key, value = match.groups()
                     if key == "progress":
@@ -267,12 +350,38 @@ class RunningScript:
                                 float(numer.strip()),
                                 float(denom.strip() or "1"),
                             )
+                            self.state_version += 1
                         except ValueError:
                             pass
                     elif key == "status":
                         self.status = value.strip()
+                        self.state_version += 1
 
-                self._report_change()
+        self._report_change()
+
+    async def _read_stream(self, stream: asyncio.StreamReader) -> None:
+        """
+        Read the a stdout/stderr stream, parsing out all scriptie progress and
+        status directives which appear.
+        """
+        try:
+            # NB: Read in large chunks (rather than using readline) to process
+            # bursts of output in one go. Any trailing partial line is held
+            # back until its newline arrives.
+            partial_line: list[bytes] = []
+            while chunk := await stream.read(STREAM_READ_SIZE):
+                last_newline = chunk.rfind(b"\n")
+                if last_newline < 0:
+                    partial_line.append(chunk)
+                    continue
+
+                partial_line.append(chunk[: last_newline + 1])
+                await self._process_output(b"".join(partial_line))
+                partial_line = [chunk[last_newline + 1 :]]
+
+            # Output not ending in a newline
+            if remainder := b"".join(partial_line):
+                await self._process_output(remainder)
         finally:
             # To avoid duplicate final end change events, only send final
             # change event for stdout stream closure
@@ -286,10 +395,14 @@ class RunningScript:
                 )  # NB created alongside _stdout_task
                 await self._stderr_task
 
+                if self._output_file_handle is not None:
+                    self._output_file_handle.close()
+
                 # Ensure we wait for actual termination, not just closure of
                 # stdout/stderr
                 self.return_code = await self._subprocess.wait()
                 self.end_time = datetime.datetime.now()
+                self.state_version += 1
 
                 self._report_change()
 
@@ -313,16 +426,16 @@ class RunningScript:
         # indeed they ever do.
         #
         # Instead we kill the while process group we created for the script to
-        # run in.
+        # run in (whose ID is the same as the script's PID).
         if self._subprocess.returncode is None:
-            os.killpg(os.getpgid(self._subprocess.pid), signal.SIGTERM)
+            os.killpg(self._subprocess.pid, signal.SIGTERM)
 
         # Give the script time to terminate gracefully
         try:
             await asyncio.wait_for(self._subprocess.wait(), terminate_timeout)
         except asyncio.TimeoutError:
             if self._subprocess.returncode is None:
-                os.killpg(os.getpgid(self._subprocess.pid), signal.SIGKILL)
+                os.killpg(self._subprocess.pid, signal.SIGKILL)
 
         await self._stdout_task
         await self._stderr_task
@@ -340,7 +453,12 @@ class RunningScript:
             # Wait for some kind of change
             event = asyncio.Event()
             self._on_change.append(event.set)
-            await event.wait()
+            try:
+                await event.wait()
+            finally:
+                # Don't leave a stale callback behind if cancelled
+                if event.set in self._on_change:
+                    self._on_change.remove(event.set)
 
     async def get_output(self, after: int | None = None) -> str:
         """
@@ -354,9 +472,19 @@ class RunningScript:
         if after is None:
             return self.output
 
-        await self._wait_for_change_or_exit(lambda: len(self.output) > cast(int, after))
+        await self._wait_for_change_or_exit(lambda: self._output_length > cast(int, after))
+
+        if after >= self._output_length:
+            return ""
 
-        return self.output[after:]
+        # Join only the chunks containing output after the given offset
+        first = max(bisect.bisect_right(self._output_offsets, after) - 1, 0)
+        return "".join(
+            [
+                self._output_chunks[first][after - self._output_offsets[first] :],
+                *self._output_chunks[first + 1 :],
+            ]
+        )
 
     async def get_status(self, old_status: str | None = None) -> str:
         """
@@ -19,7 +19,8 @@ Arguments must be given with names arg0, arg1, and so on.
 File uploads will be saved to a temporary directory and a filename passed to
 the script insteaed. All other arguments are passed as is. There is no checking
 that the provided values correspond in any way with the arguments the script
-describes itself as accepting.
+describes itself as accepting. When sent as multipart/form-data, non-file
+arguments larger than the configured maximum (64 KiB by default) are rejected.
 
 The response contains the ID of the newly running script.
 
@@ -48,7 +49,29 @@ record of it from the server.
 GET /running/{id}/output
 ------------------------
 
-Returns the current (interleaved) stdout/stderr contents.
+Returns the current (interleaved) stdout/stderr contents. This is served
+directly from a file on disk to which the output is written as it arrives.
+
+HTTP Range requests are supported, so a client which has already read N bytes
+of output may fetch just the remainder using the header ``Range: bytes=N-``.
+
+
+GET /running/{id}/events
+------------------------
+
+A Server-Sent Events (text/event-stream) stream reporting changes to the
+script's state as they occur. Each event's data is JSON encoded. The following
+events are produced:
+
+* ``output``: New output (interleaved stdout/stderr) produced by the script.
+* ``status``: The script's status. Sent immediately and then on change.
+* ``progress``: The script's progress. Sent immediately and then on change.
+* ``return_code``: Sent once the script has exited, after which the stream
+  ends.
+
+The initial status and progress events are always the first two events sent.
+Whilst the script is idle, a comment line (``: keepalive``) is sent
+periodically.
 
 
 POST /running/{id}/kill
@@ -110,26 +133,35 @@ import asyncio
 
 from typing import cast, Any
 
+from collections.abc import Callable, Awaitable, Coroutine
+
 from aiohttp import web, BodyPartReader, WSMsgType, WSCloseCode
 
 from pathlib import Path
 
+import os
+
 import json
 
-import uuid
+import functools
+
+import re
+
+import secrets
 
 import traceback
 
 import datetime
 
-from tempfile import TemporaryDirectory
+from tempfile import mkdtemp
 
-from itertools import count
+import shutil
 
 from weakref import WeakSet
 
 from scriptie.scripts import (
-    enumerate_scripts,
+    read_script,
+    Script,
     RunningScript,
 )
 
@@ -139,13 +171,63 @@ STATIC_FILE_DIR = Path(__file__).parent / "static_files"
 Directory in which static files (e.g. the web UI) are stored.
 """
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+"""
+Number of bytes of an uploaded file to read (and write to disk) at a time.
+"""
+
+ARG_NAME_RE = re.compile(r"arg(0|[1-9][0-9]*)")
+"""
+Matches (in full) the name of an argument field (arg0, arg1, ...), capturing
+the argument number.
+"""
+
 routes = web.RouteTableDef()
 
 
+def json_dumps(value: Any) -> str:
+    """Encode a value as compact (whitespace-free) JSON."""
+    return json.dumps(value, separators=(",", ":"))
+
+
+# Equivalent to aiohttp.web.json_response but produces compact JSON
+json_response = functools.partial(web.json_response, dumps=json_dumps)
+
+
+def get_script_index(app: web.Application) -> dict[str, Script]:
+    """
+    Return a {executable name: Script} dict describing every script in
+    app["script_dir"].
+
+    Parsed scripts are cached in app["script_index"] and only re-read when
+    their modification time, size or mode changes, so in the common case this
+    costs one stat per script rather than reading and parsing every file.
+    """
+    script_dir: Path = app["script_dir"]
+    index: dict[str, tuple[tuple[int, int, int], Script]] = app["script_index"]
+    new_index: dict[str, tuple[tuple[int, int, int], Script]] = {}
+
+    with os.scandir(script_dir) as entries:
+        for entry in entries:
+            if not (entry.is_file() and os.access(entry.path, mode=os.X_OK)):
+                continue
+
+            stat = entry.stat()
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_mode)
+            cached = index.get(entry.name)
+            if cached is not None and cached[0] == signature:
+                new_index[entry.name] = cached
+            else:
+                new_index[entry.name] = (signature, read_script(Path(entry.path)))
+
+    index.clear()
+    index.update(new_index)
+    return {name: script for name, (_signature, script) in new_index.items()}
+
+
 @routes.get("/scripts/")
 async def get_scripts(request: web.Request) -> web.Response:
-    script_dir: Path = request.app["script_dir"]
-    return web.json_response(
+    return json_response(
         [
             {
                 "script": script.executable.name,
@@ -159,22 +241,18 @@ async def get_scripts(request: web.Request) -> web.Response:
                     for arg in script.args
                 ],
             }
-            for script in enumerate_scripts(script_dir)
+            for script in get_script_index(request.app).values()
         ]
     )
 
 
 @routes.get("/scripts/{script}")
 async def get_script(request: web.Request) -> web.Response:
-    script_dir: Path = request.app["script_dir"]
-    scripts = {
-        script.executable.name: script for script in enumerate_scripts(script_dir)
-    }
-    script = scripts.get(request.match_info["script"])
+    script = get_script_index(request.app).get(request.match_info["script"])
     if script is None:
         raise web.HTTPNotFound()
 
-    return web.json_response(
+    return json_response(
         {
             "script": script.executable.name,
             "name": script.name,
@@ -190,22 +268,53 @@ async def get_script(request: web.Request) -> web.Response:
     )
 
 
-@routes.post("/scripts/{script}")
-async def run_script(request: web.Request) -> web.Response:
-    script_dir: Path = request.app["script_dir"]
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-    temporary_dirs: dict[str, list[TemporaryDirectory]] = request.app["temporary_dirs"]
-    cleanup_tasks: list[asyncio.Future] = request.app["cleanup_tasks"]
+async def read_form_field(part: BodyPartReader, max_size: int) -> str:
+    """
+    Read the (non-file) multipart form field value in the provided part.
+    Responds with HTTP 413 (Request Entity Too Large) if the value is longer
+    than max_size bytes.
+    """
+    value = bytearray()
+    while chunk := await part.read_chunk():
+        value += chunk
+        if len(value) > max_size:
+            raise web.HTTPRequestEntityTooLarge(
+                max_size=max_size,
+                actual_size=len(value),
+            )
+    return bytes(part.decode(value)).decode(part.get_charset(default="utf-8"))
 
-    scripts = {
-        script.executable.name: script for script in enumerate_scripts(script_dir)
-    }
-    script = scripts.get(request.match_info["script"])
-    if script is None:
-        raise web.HTTPNotFound()
 
+def make_upload_path(directory: Path, filename: str) -> Path:
+    """
+    Pick a path within the given directory to which an uploaded file with the
+    given (client supplied) filename can be written.
+
+    Only the final component of the filename is used. If a file of that name
+    already exists, a new subdirectory is created to hold the file so that
+    the filename is preserved. The directory itself is created if it doesn't
+    exist yet.
+    """
+    directory.mkdir(exist_ok=True)
+
+    name = Path(filename).name
+    if name in ("", ".."):
+        name = "no_name"
+
+    path = directory / name
+    if path.exists():
+        path = Path(mkdtemp(dir=directory)) / name
+    return path
+
+
+async def read_args(request: web.Request, upload_directory: Path) -> list[str]:
+    """
+    Read the arguments to pass to a script from a POST request's body.
+
+    Uploaded files are written into upload_directory and their filenames
+    passed as the argument instead.
+    """
     args_by_name: dict[str, str] = {}
-    temp_dirs: list[TemporaryDirectory] = []
 
     # Collect arguments
     if request.content_type == "application/x-www-form-urlencoded":
@@ -217,50 +326,100 @@ async def run_script(request: web.Request) -> web.Response:
 
             assert isinstance(part, BodyPartReader)
             if part.filename is None:
-                args_by_name[part.name] = await part.text()
+                args_by_name[part.name] = await read_form_field(
+                    part, request.app["max_field_size"]
+                )
             else:
                 # Convert uploaded files into a filename for said argument
-                file_contents = await part.read()
-                if file_contents == b"" and not part.filename:
+                chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+                if chunk == b"" and not part.filename:
                     # Special case: No file selected
                     args_by_name[part.name] = ""
                 else:
-                    temp_dir = TemporaryDirectory(
-                        prefix=f"{script.executable.name}_upload_",
-                        ignore_cleanup_errors=True,
-                    )
-                    temp_dirs.append(temp_dir)
-                    arg_file = Path(temp_dir.name) / (part.filename or "no_name")
-                    arg_file.write_bytes(file_contents)
+                    arg_file = make_upload_path(upload_directory, part.filename)
+
+                    # Stream the upload to disk a chunk at a time (rather than
+                    # holding the whole file in memory) without blocking the
+                    # event loop on the writes.
+                    loop = asyncio.get_running_loop()
+                    with arg_file.open("wb") as f:
+                        while chunk:
+                            await loop.run_in_executor(None, f.write, chunk)
+                            chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+
                     args_by_name[part.name] = str(arg_file)
     else:
         # Assume no arguments
         pass
 
-    # Order arguments appropriately
+    # Order arguments appropriately (stopping at any gap in the numbering)
+    arg_names_by_index = {
+        int(match[1]): name
+        for name in args_by_name
+        if (match := ARG_NAME_RE.fullmatch(name))
+    }
     args: list[str] = []
-    for n in count():
-        name = f"arg{n}"
-        if name in args_by_name:
-            args.append(args_by_name.pop(name))
-        else:
-            break
+    while (name := arg_names_by_index.get(len(args))) is not None:
+        args.append(args_by_name.pop(name))
 
     # Check non left over
     if args_by_name:
         raise web.HTTPBadRequest(text=f"Unexpected fields: {', '.join(args_by_name)}")
 
+    return args
+
+
+def remove_temp_dirs(temp_dirs: list[str]) -> None:
+    """
+    Delete the given temporary directories (and their contents), removing
+    them from the list.
+    """
+    while temp_dirs:
+        shutil.rmtree(temp_dirs.pop(), ignore_errors=True)
+
+
+@routes.post("/scripts/{script}")
+async def run_script(request: web.Request) -> web.Response:
+    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
+    cleanup_tasks: set[asyncio.Task] = request.app["cleanup_tasks"]
+
+    script = get_script_index(request.app).get(request.match_info["script"])
+    if script is None:
+        raise web.HTTPNotFound()
+
+    # Create a single directory to hold the script's output and any uploaded
+    # files (kept out of the working directory). The output and uploads are
+    # kept in separate subdirectories so that no upload (whose name the client
+    # chooses) can interfere with the output file. (For example, FileResponse
+    # would serve an uploaded 'output.txt.gz' in place of 'output.txt' to
+    # clients accepting gzip.) The uploads directory is only created if a file
+    # is actually uploaded.
+    files_directory = mkdtemp(prefix=f"{script.executable.name}_files_")
+    temp_dirs: list[str] = [files_directory]
+    output_directory = Path(files_directory) / "output"
+    output_directory.mkdir()
+    output_file = output_directory / "output.txt"
+    upload_directory = Path(files_directory) / "files"
+
+    try:
+        args = await read_args(request, upload_directory)
+    except BaseException:
+        remove_temp_dirs(temp_dirs)
+        raise
+
     # Create working directory for script
-    working_directory = TemporaryDirectory(
-        prefix=f"{script.executable.name}_",
-        ignore_cleanup_errors=True,
-    )
+    working_directory = mkdtemp(prefix=f"{script.executable.name}_")
     temp_dirs.append(working_directory)
 
     # Actually run the script
-    rs_id = str(uuid.uuid4())
-    rs = running_scripts[rs_id] = RunningScript(script, args, Path(working_directory.name))
-    temporary_dirs[rs_id] = temp_dirs
+    rs_id = secrets.token_urlsafe(16)
+    rs = running_scripts[rs_id] = RunningScript(
+        script,
+        args,
+        Path(working_directory),
+        output_file,
+    )
+    rs.temp_dirs = temp_dirs
     running_scripts_changed(request.app)
 
     async def cleanup() -> None:
@@ -271,10 +430,13 @@ async def run_script(request: web.Request) -> web.Response:
             running_scripts_changed(request.app)
         finally:  # In case of cancellation
             # NB: Files kept around until expiary to aid debugging
-            for temp_dir in temporary_dirs.pop(rs_id, []):
-                temp_dir.cleanup()
+            remove_temp_dirs(rs.temp_dirs)
 
-    cleanup_tasks.append(asyncio.create_task(cleanup()))
+    # NB: Tasks remove themselves once done so that only pending cleanups are
+    # kept around
+    cleanup_task = asyncio.create_task(cleanup())
+    cleanup_tasks.add(cleanup_task)
+    cleanup_task.add_done_callback(cleanup_tasks.discard)
 
     return web.Response(text=rs_id)
 
@@ -284,6 +446,7 @@ def running_scripts_changed(app: web.Application) -> None:
     running_scripts_changed: asyncio.Event = app["running_scripts_changed"][0]
     running_scripts_changed.set()
     app["running_scripts_changed"][0] = asyncio.Event()
+    app["running_scripts_generation"][0] += 1
 
 async def wait_for_running_scripts_change(app: web.Application) -> None:
     """Notify all waiting processes that app["running_scripts"] has chagned."""
@@ -291,31 +454,57 @@ async def wait_for_running_scripts_change(app: web.Application) -> None:
     await running_scripts_changed.wait()
 
 
+def describe_running_script(rs_id: str, rs: RunningScript) -> dict[str, Any]:
+    """Produce the JSON-serialisable description of a running script."""
+    return {
+        "id": rs_id,
+        "script": rs.script.executable.name,
+        "name": rs.script.name,
+        "args": rs.args,
+        "working_directory": str(rs.working_directory),
+        "start_time": rs.start_time.isoformat(),
+        "end_time": rs.end_time.isoformat() if rs.end_time is not None else None,
+        "progress": rs.progress,
+        "status": rs.status,
+        "return_code": rs.return_code,
+    }
+
+
 def enumerate_running(running_scripts: dict[str, RunningScript]) -> list[dict[str, Any]]:
-    return [
-        {
-            "id": rs_id,
-            "script": rs.script.executable.name,
-            "name": rs.script.name,
-            "args": rs.args,
-            "working_directory": str(rs.working_directory),
-            "start_time": rs.start_time.isoformat(),
-            "end_time": rs.end_time.isoformat()
-            if rs.end_time is not None
-            else None,
-            "progress": rs.progress,
-            "status": rs.status,
-            "return_code": rs.return_code,
-        }
-        for rs_id, rs in running_scripts.items()
-    ]
+    return [describe_running_script(rs_id, rs) for rs_id, rs in running_scripts.items()]
+
+
+def enumerate_running_json(app: web.Application) -> tuple[str, bytes]:
+    """
+    Return the JSON encoded enumerate_running output for app["running_scripts"]
+    both as a str and as UTF-8 encoded bytes.
+
+    The encoded values are cached and only regenerated when the set of running
+    scripts changes or one of their states (but not outputs) change.
+    """
+    running_scripts: dict[str, RunningScript] = app["running_scripts"]
+    cache: dict[tuple[int, int], tuple[str, bytes]] = app["running_json_cache"]
+
+    # NB: Whilst the generation is unchanged the set of running scripts is
+    # fixed and since state_version only ever increases, the sum will change
+    # whenever any of those scripts' states change.
+    key = (
+        app["running_scripts_generation"][0],
+        sum(rs.state_version for rs in running_scripts.values()),
+    )
+    if key not in cache:
+        cache.clear()
+        text = json_dumps(enumerate_running(running_scripts))
+        cache[key] = (text, text.encode())
+    return cache[key]
 
 
 @routes.get("/running/")
 async def get_running(request: web.Request) -> web.Response:
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-
-    return web.json_response(enumerate_running(running_scripts))
+    return web.Response(
+        body=enumerate_running_json(request.app)[1],
+        content_type="application/json",
+    )
 
 
 @routes.get("/running/ws")
@@ -342,7 +531,12 @@ async def get_running_websocket(request: web.Request) -> web.WebSocketResponse:
                     async def wait_for_running_change(command_id: str, old_rs_ids: list[str]) -> None:
                         while set(running_scripts) == set(old_rs_ids):
                             await wait_for_running_scripts_change(request.app)
-                        await ws.send_json({"id": command_id, "value": enumerate_running(running_scripts)})
+                        # NB: The (cached) encoded value is inserted directly
+                        # rather than being decoded and re-encoded
+                        running_json, _ = enumerate_running_json(request.app)
+                        await ws.send_str(
+                            f'{{"id":{json_dumps(command_id)},"value":{running_json}}}'
+                        )
                     
                     tasks[command_id] = asyncio.create_task(
                         wait_for_running_change(command_id, old_rs_ids)
@@ -409,86 +603,178 @@ async def get_running_websocket(request: web.Request) -> web.WebSocketResponse:
 
 @routes.get("/running/{id}")
 async def get_running_script(request: web.Request) -> web.Response:
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-    rs_id = request.match_info["id"]
-    rs: RunningScript | None = running_scripts.get(rs_id)
-    if rs is None:
-        raise web.HTTPNotFound()
-
-    return web.json_response(
-        {
-            "id": rs_id,
-            "script": rs.script.executable.name,
-            "name": rs.script.name,
-            "args": rs.args,
-            "working_directory": str(rs.working_directory),
-            "start_time": rs.start_time.isoformat(),
-            "end_time": rs.end_time.isoformat() if rs.end_time is not None else None,
-            "progress": rs.progress,
-            "status": rs.status,
-            "return_code": rs.return_code,
-        }
-    )
+    rs: RunningScript = request["rs"]
+    return json_response(describe_running_script(request.match_info["id"], rs))
 
 
 @routes.delete("/running/{id}")
 async def delete_running_script(request: web.Request) -> web.Response:
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-    temporary_dirs: dict[str, list[TemporaryDirectory]] = request.app["temporary_dirs"]
     rs_id = request.match_info["id"]
-    rs: RunningScript | None = running_scripts.get(rs_id, None)
-    if rs is None:
-        raise web.HTTPNotFound()
+    rs: RunningScript = request["rs"]
 
     await rs.kill()
 
-    running_scripts.pop(rs_id, None)
+    request.app["running_scripts"].pop(rs_id, None)
     running_scripts_changed(request.app)
 
-    for temp_dir in temporary_dirs.pop(rs_id, []):
-        temp_dir.cleanup()
+    remove_temp_dirs(rs.temp_dirs)
 
     return web.Response()
 
 
 @routes.get("/running/{id}/output")
-async def get_output(request: web.Request) -> web.Response:
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-    rs: RunningScript | None = running_scripts.get(request.match_info["id"])
-    if rs is None:
-        raise web.HTTPNotFound()
+async def get_output(request: web.Request) -> web.FileResponse:
+    rs: RunningScript = request["rs"]
+
+    # NB: Served straight from the file the output is spooled to (letting
+    # aiohttp use sendfile) rather than copying rs.output into a response
+    assert rs.output_file is not None
+    return web.FileResponse(
+        rs.output_file,
+        headers={
+            "Content-Type": "text/plain; charset=utf-8",
+            # NB: The file may still be growing so must always be revalidated
+            "Cache-Control": "no-cache",
+        },
+    )
+
+
+@routes.get("/running/{id}/events")
+async def get_events(request: web.Request) -> web.StreamResponse:
+    rs: RunningScript = request["rs"]
+
+    resp = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        },
+    )
+    await resp.prepare(request)
+
+    async def send_event(event: str, value: Any) -> None:
+        await resp.write(f"event: {event}\ndata: {json_dumps(value)}\n\n".encode())
+
+    # The most recently sent values, starting with the current status and
+    # progress which are sent before anything else.
+    output_length = 0
+    status = rs.status
+    progress = rs.progress
+
+    waiters: dict[str, Callable[[], Coroutine[Any, Any, Any]]] = {
+        "output": lambda: rs.get_output(output_length),
+        "status": lambda: rs.get_status(status),
+        "progress": lambda: rs.get_progress(progress),
+    }
+    tasks: dict[asyncio.Task, str] = {}
+
+    try:
+        await send_event("status", status)
+        await send_event("progress", progress)
+
+        for event, waiter in waiters.items():
+            tasks[asyncio.create_task(waiter())] = event
 
-    return web.Response(text=rs.output)
+        while tasks:
+            done, _pending = await asyncio.wait(
+                tasks,
+                timeout=request.app["events_keepalive_interval"],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            # NB: Periodically writing something while idle causes a write
+            # error (ending this handler) once the client has disconnected.
+            # Without this, the handler would remain blocked until the next
+            # change in the script's state, which might never come.
+            if not done:
+                await resp.write(b": keepalive\n\n")
+
+            for task in done:
+                event = tasks.pop(task)
+                value = task.result()
+
+                # Each waiter returns an unchanged value only once the script
+                # has exited, at which point we stop waiting on it.
+                if event == "output":
+                    if not value:
+                        continue
+                    output_length += len(value)
+                elif event == "status":
+                    if value == status:
+                        continue
+                    status = value
+                elif event == "progress":
+                    if value == progress:
+                        continue
+                    progress = value
+
+                await send_event(event, value)
+                tasks[asyncio.create_task(waiters[event]())] = event
+
+        await send_event("return_code", await rs.get_return_code())
+        await resp.write_eof()
+    except ConnectionResetError:
+        pass  # Client disconnected
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return resp
 
 
 @routes.post("/running/{id}/kill")
 async def post_kill(request: web.Request) -> web.Response:
-    running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
-    rs: RunningScript | None = running_scripts.get(request.match_info["id"])
-    if rs is None:
-        raise web.HTTPNotFound()
+    rs: RunningScript = request["rs"]
 
     await rs.kill()
 
     return web.Response()
 
 
+@web.middleware
+async def running_script_middleware(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    """
+    For routes with an {id} in their path, look up the RunningScript with that
+    ID (responding 404 if there is none) and make it available to the handler
+    as request["rs"].
+    """
+    if "id" in request.match_info:
+        running_scripts: dict[str, RunningScript] = request.app["running_scripts"]
+        rs: RunningScript | None = running_scripts.get(request.match_info["id"])
+        if rs is None:
+            raise web.HTTPNotFound()
+        request["rs"] = rs
+
+    return await handler(request)
+
+
 @routes.get('/')
 async def get_index(request: web.Request) -> web.FileResponse:
     return web.FileResponse(STATIC_FILE_DIR / "index.html")
 
 routes.static('/', STATIC_FILE_DIR)
 
-def make_app(script_dir: Path, job_cleanup_delay: float = 24 * 60 * 60) -> web.Application:
-    app = web.Application()
+def make_app(
+    script_dir: Path,
+    job_cleanup_delay: float = 24 * 60 * 60,
+    max_field_size: int = 64 * 1024,
+    events_keepalive_interval: float = 15.0,
+) -> web.Application:
+    app = web.Application(middlewares=[running_script_middleware])
     app.add_routes(routes)
 
     app["script_dir"] = script_dir
+    app["script_index"] = {}  # See get_script_index
     app["job_cleanup_delay"] = job_cleanup_delay
+    app["max_field_size"] = max_field_size  # Bytes, for non-file form fields
+    app["events_keepalive_interval"] = events_keepalive_interval  # Seconds
     app["running_scripts"] = {}
     app["running_scripts_changed"] = [asyncio.Event()]
-    app["temporary_dirs"] = {}  # List of TemporaryDirectory per running script
-    app["cleanup_tasks"] = []
+    app["running_scripts_generation"] = [0]  # Incremented on every change
+    app["running_json_cache"] = {}  # See enumerate_running_json
+    app["cleanup_tasks"] = set()
     app["websockets"] = WeakSet()
 
     @app.on_shutdown.append
@@ -505,9 +791,9 @@ def make_app(script_dir: Path, job_cleanup_delay: float = 24 * 60 * 60) -> web.A
                 message=b"Server shutdown",
             )
 
-        # Cancel all scheduled cleanup tasks (temporary directories will be
-        # deleted automatically anyway on shutdown)
-        for task in app["cleanup_tasks"]:
+        # Cancel all scheduled cleanup tasks (which will delete their
+        # temporary directories as they're cancelled)
+        for task in set(app["cleanup_tasks"]):
             task.cancel()
             try:
                 await task
@@ -517,6 +803,19 @@ def make_app(script_dir: Path, job_cleanup_delay: float = 24 * 60 * 60) -> web.A
     return app
 
 
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Create the event loop to run the server in: a (faster) uvloop event loop if
+    uvloop is installed, or the default asyncio event loop otherwise.
+    """
+    try:
+        import uvloop  # type: ignore[import-not-found]
+    except ImportError:
+        return asyncio.new_event_loop()
+    else:
+        return uvloop.new_event_loop()
+
+
 def main() -> None:
     """
     Run the server from the command line.
@@ -565,10 +864,15 @@ def main() -> None:
     
     args = parser.parse_args()
     
+    # NB: All state (running scripts, their output and so on) lives in this
+    # process's memory so the server must run as a single process: multiple
+    # workers (e.g. sharing a port via SO_REUSEPORT) would each see only the
+    # scripts they started themselves.
     web.run_app(
         make_app(args.script_directory, args.job_cleanup_delay),
         host=args.host,
         port=args.port,
+        loop=new_event_loop(),
     )
 
 
@@ -199,6 +199,92 @@ class TestRunningScript:
         await rs.get_return_code()
         assert await rs.get_output(len("hello, world\ngoodbye\n")) == ""
 
+    async def test_output_incremental(
+        self, make_script: Callable[[str], Script]
+    ) -> None:
+        rs = RunningScript(
+            make_script(
+                """
+                for i in 1 2 3 4 5; do
+                    echo "line $i"
+                    sleep 0.01
+                done
+                """
+            )
+        )
+
+        # Read each new chunk as it arrives
+        output = ""
+        while new := await rs.get_output(len(output)):
+            output += new
+        assert output == "".join(f"line {i}\n" for i in range(1, 6))
+
+        # Reading after every offset (including mid-chunk) should give the
+        # remainder of the output
+        for after in range(len(output) + 1):
+            assert await rs.get_output(after) == output[after:]
+
+        # Still correct once the chunks have been joined together
+        assert rs.output == output
+        for after in range(len(output) + 1):
+            assert await rs.get_output(after) == output[after:]
+
+    async def test_output_file(
+        self,
+        tmp_path: Path,
+        make_script: Callable[[str], Script],
+    ) -> None:
+        output_file = tmp_path / "output.txt"
+        rs = RunningScript(
+            make_script(
+                """
+                echo hello, world
+                sleep 0.1
+                echo goodbye 1>&2
+                """
+            ),
+            output_file=output_file,
+        )
+
+        # Should be created immediately
+        assert output_file.read_bytes() == b""
+
+        # Should be written as output arrives
+        assert await rs.get_output(0) == "hello, world\n"
+        assert output_file.read_bytes() == b"hello, world\n"
+
+        await rs.get_return_code()
+        assert output_file.read_bytes() == b"hello, world\ngoodbye\n"
+
+    async def test_output_file_closed_on_failed_start(self, tmp_path: Path) -> None:
+        script_file = tmp_path / "script.sh"
+        script_file.write_text("#!/does/not/exist\n")
+        script_file.chmod(0o777)
+
+        rs = RunningScript(Script(script_file), output_file=tmp_path / "output.txt")
+        with pytest.raises(OSError):
+            await rs._run_task
+        assert rs._output_file_handle is not None
+        assert rs._output_file_handle.closed
+
+    async def test_output_long_lines(
+        self, make_script: Callable[[str], Script]
+    ) -> None:
+        # Lines longer than any read buffer and an unterminated final line
+        rs = RunningScript(
+            make_script(
+                """
+                head -c 200000 /dev/zero | tr '\\0' x
+                echo
+                echo "## status: Done"
+                printf "No newline"
+                """
+            )
+        )
+        await rs.get_return_code()
+        assert await rs.get_output() == ("x" * 200000) + "\n## status: Done\nNo newline"
+        assert await rs.get_status() == "Done"
+
     async def test_working_directory(
         self,
         tmp_path: Path,
@@ -265,6 +351,34 @@ class TestRunningScript:
         await rs.get_return_code()
         assert await rs.get_progress((4, 4)) == (4, 4)
 
+    async def test_state_version(self, make_script: Callable[[str], Script]) -> None:
+        rs = RunningScript(
+            make_script(
+                """
+                echo "Just output"
+                sleep 0.05
+                echo "## status: Started..."
+                sleep 0.05
+                echo "## progress: 1/2"
+                """
+            )
+        )
+        assert rs.state_version == 0
+
+        # Output alone doesn't count
+        assert await rs.get_output(0) == "Just output\n"
+        assert rs.state_version == 0
+
+        assert await rs.get_status("") == "Started..."
+        assert rs.state_version == 1
+
+        assert await rs.get_progress((0, 0)) == (1, 2)
+        assert rs.state_version == 2
+
+        # Exit counts
+        await rs.get_return_code()
+        assert rs.state_version == 3
+
     async def test_kill_terminate(self, make_script: Callable[[str], Script]) -> None:
         rs = RunningScript(
             make_script(
@@ -1,7 +1,7 @@
 import pytest
 
 from typing import Any
-from collections.abc import Callable, Awaitable, AsyncIterable
+from collections.abc import Callable, Awaitable, AsyncIterable, Iterator
 
 import asyncio
 
@@ -14,11 +14,21 @@ from multidict import MultiDict
 
 import datetime
 
-import uuid
+import functools
+
+import json
+
+import logging
+
+import itertools
+
+import sys
+
+import tempfile
 
 from textwrap import dedent
 
-from scriptie.server import make_app
+from scriptie.server import make_app, UPLOAD_CHUNK_SIZE
 
 
 @pytest.fixture
@@ -58,11 +68,15 @@ class RunningWSClient:
     
     _waiting_commands: dict[str, asyncio.Future]
     
+    # Source of command IDs (only required to be unique per connection)
+    _command_ids: Iterator[str]
+    
     _rx_task: asyncio.Task
     
     def __init__(self, client: ClientSession) -> None:
         self._client = client
         self._waiting_commands = {}
+        self._command_ids = map(str, itertools.count())
     
     async def _open(self) -> None:
         self._ws = await self._client.ws_connect("/running/ws")
@@ -89,15 +103,19 @@ class RunningWSClient:
                     else:
                         future.set_exception(RunningWSCommandError(response.get("error", "Missing 'error' or 'value'")))
         except Exception as e:
-            while self._waiting_commands:
-                self._waiting_commands.popitem()[1].set_exception(e)
+            for future in self._waiting_commands.values():
+                if not future.done():
+                    future.set_exception(e)
+            self._waiting_commands.clear()
             raise
     
     def __getattr__(self, command_type: str) -> Callable[..., Any]:
         async def cmd(**args) -> Any:
-            command_id = str(uuid.uuid4())
-            future = self._waiting_commands[command_id] = asyncio.Future()
-            await self._ws.send_json(dict(args, id=command_id, type=command_type))
+            command_id = next(self._command_ids)
+            future = self._waiting_commands[command_id] = (
+                asyncio.get_running_loop().create_future()
+            )
+            await self._ws.send_json({**args, "id": command_id, "type": command_type})
             try:
                 return await future
             except asyncio.CancelledError:
@@ -157,12 +175,54 @@ async def test_script_enumeration(server: ClientSession, script_dir: Path) -> No
     }
 
 
+async def test_script_enumeration_tracks_changes(
+    server: ClientSession, script_dir: Path
+) -> None:
+    async def get_names() -> dict[str, str]:
+        resp = await server.get("/scripts/")
+        return {script["script"]: script["name"] for script in await resp.json()}
+
+    script_filename = script_dir / "foo.sh"
+    script_filename.write_text("## name: Before")
+    assert await get_names() == {}
+
+    # Becoming executable should be noticed
+    script_filename.chmod(0o777)
+    assert await get_names() == {"foo.sh": "Before"}
+
+    # Changes to contents should be noticed
+    script_filename.write_text("## name: After changes")
+    assert await get_names() == {"foo.sh": "After changes"}
+    assert (await (await server.get("/scripts/foo.sh")).json())["name"] == (
+        "After changes"
+    )
+
+    # Becoming non-executable should be noticed
+    script_filename.chmod(0o666)
+    assert await get_names() == {}
+    assert (await server.get("/scripts/foo.sh")).status == 404
+
+    # Deletion should be noticed
+    script_filename.chmod(0o777)
+    assert await get_names() == {"foo.sh": "After changes"}
+    script_filename.unlink()
+    assert await get_names() == {}
+
+
+@functools.cache
+def prepare_script_source(source: str) -> bytes:
+    """
+    Dedent and encode a test script's source. Cached since the same few
+    scripts are written out afresh for many tests.
+    """
+    return dedent(source).strip().encode()
+
 
 @pytest.fixture
 def make_script(script_dir: Path) -> Callable[[str, str], None]:
     def make_script(name: str, source: str) -> None:
         script = script_dir / name
-        script.write_text(dedent(source).strip())
+        script.write_bytes(prepare_script_source(source))
         script.chmod(0o777)
 
     return make_script
@@ -172,8 +232,8 @@ def make_script(script_dir: Path) -> Callable[[str, str], None]:
 def print_args_sh(make_script: Callable[[str, str], None]) -> None:
     make_script(
         "print_args.sh",
-        r"""
-            #!/usr/bin/env python
+        rf"""
+            #!{sys.executable}
             import sys
             print("\n".join(sys.argv[1:]))
         """,
@@ -273,6 +333,31 @@ async def test_run_script_simple_args(
     ]
 
 
+async def test_run_script_arg_too_large(
+    aiohttp_client: Callable[[web.Application], Awaitable[ClientSession]],
+    script_dir: Path,
+    print_args_sh: None,
+) -> None:
+    app = make_app(script_dir, max_field_size=10)
+    server = await aiohttp_client(app)
+
+    with MultipartWriter("form-data") as mpwriter:
+        multipart_append_form_field(mpwriter, "arg0", "Not too big")
+    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+    assert resp.status == 413
+
+    with MultipartWriter("form-data") as mpwriter:
+        multipart_append_form_field(mpwriter, "arg0", "Just right")
+    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+    assert resp.status == 200
+    rs_id = await resp.text()
+
+    # Wait for the script to complete
+    assert await app["running_scripts"][rs_id].get_return_code() == 0
+    args = await (await server.get(f"/running/{rs_id}/output")).text()
+    assert args == "Just right\n"
+
+
 async def test_run_script_with_file(
     server: ClientSession,
     running_ws_client: RunningWSClient,
@@ -282,17 +367,18 @@ async def test_run_script_with_file(
     file_to_send = tmp_path / "to_send.txt"
     file_to_send.write_text("Hello, world!")
 
-    with MultipartWriter("form-data") as mpwriter:
-        multipart_append_form_field(mpwriter, "arg0", "The first")
+    with file_to_send.open("rb") as fh:
+        with MultipartWriter("form-data") as mpwriter:
+            multipart_append_form_field(mpwriter, "arg0", "The first")
 
-        part = mpwriter.append(file_to_send.open("rb"))
-        part.set_content_disposition(
-            "attachment",
-            name="arg1",
-            filename="to_send.txt",
-        )
+            part = mpwriter.append(fh)
+            part.set_content_disposition(
+                "attachment",
+                name="arg1",
+                filename="to_send.txt",
+            )
 
-    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+        resp = await server.post("/scripts/print_args.sh", data=mpwriter)
 
     assert resp.status == 200
     rs_id = await resp.text()
@@ -311,10 +397,142 @@ async def test_run_script_with_file(
     assert args[0] == "The first"
 
     assert Path(args[1]).name == "to_send.txt"
-    assert Path(args[1]).parent.name.startswith("print_args.sh_")
+    assert Path(args[1]).parent.name == "files"
+    assert Path(args[1]).parent.parent.name.startswith("print_args.sh_")
     assert Path(args[1]).read_text() == "Hello, world!"
 
 
+async def test_run_script_with_large_file(
+    server: ClientSession,
+    running_ws_client: RunningWSClient,
+    print_args_sh: None,
+    tmp_path: Path,
+) -> None:
+    # Large enough to be received in many chunks
+    file_contents = bytes(range(256)) * (UPLOAD_CHUNK_SIZE // 64)
+
+    file_to_send = tmp_path / "to_send.bin"
+    file_to_send.write_bytes(file_contents)
+
+    with file_to_send.open("rb") as fh:
+        with MultipartWriter("form-data") as mpwriter:
+            part = mpwriter.append(fh)
+            part.set_content_disposition(
+                "attachment",
+                name="arg0",
+                filename="to_send.bin",
+            )
+
+        resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+
+    assert resp.status == 200
+    rs_id = await resp.text()
+
+    # Wait for script to complete
+    await running_ws_client.get_return_code(rs_id=rs_id)
+
+    # Check file arrived intact
+    arg = (await (await server.get(f"/running/{rs_id}/output")).text()).strip()
+    assert Path(arg).read_bytes() == file_contents
+
+
+async def test_run_script_with_clashing_files(
+    server: ClientSession,
+    running_ws_client: RunningWSClient,
+    print_args_sh: None,
+) -> None:
+    with MultipartWriter("form-data") as mpwriter:
+        for n, (filename, contents) in enumerate(
+            [
+                ("same.txt", b"First"),
+                ("same.txt", b"Second"),
+                ("output.txt", b"Not the output"),
+            ]
+        ):
+            part = mpwriter.append(contents)
+            part.set_content_disposition(
+                "attachment",
+                name=f"arg{n}",
+                filename=filename,
+            )
+
+    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+
+    assert resp.status == 200
+    rs_id = await resp.text()
+
+    # Wait for script to complete
+    await running_ws_client.get_return_code(rs_id=rs_id)
+
+    args = [
+        Path(arg)
+        for arg in (await (await server.get(f"/running/{rs_id}/output")).text())
+        .strip()
+        .split("\n")
+    ]
+    assert [arg.name for arg in args] == [
+        "same.txt",
+        "same.txt",
+        "output.txt",
+    ]
+    assert [arg.read_bytes() for arg in args] == [
+        b"First",
+        b"Second",
+        b"Not the output",
+    ]
+
+
+async def test_run_script_with_output_like_files(
+    server: ClientSession,
+    running_ws_client: RunningWSClient,
+    print_args_sh: None,
+) -> None:
+    # Uploads which might be confused with (or served in place of) the output
+    with MultipartWriter("form-data") as mpwriter:
+        for n, filename in enumerate(["output.txt", "output.txt.gz", "output.txt.br"]):
+            part = mpwriter.append(b"Not the output")
+            part.set_content_disposition(
+                "attachment",
+                name=f"arg{n}",
+                filename=filename,
+            )
+
+    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+    assert resp.status == 200
+    rs_id = await resp.text()
+    await running_ws_client.get_return_code(rs_id=rs_id)
+
+    resp = await server.get(
+        f"/running/{rs_id}/output",
+        headers={"Accept-Encoding": "gzip, br"},
+    )
+    assert resp.status == 200
+    assert "Content-Encoding" not in resp.headers
+    args = [Path(arg) for arg in (await resp.text()).strip().split("\n")]
+    assert [arg.name for arg in args] == [
+        "output.txt",
+        "output.txt.gz",
+        "output.txt.br",
+    ]
+    assert all(arg.read_bytes() == b"Not the output" for arg in args)
+
+
+async def test_run_script_without_files(
+    server: ClientSession,
+    app: web.Application,
+    running_ws_client: RunningWSClient,
+    print_args_sh: None,
+) -> None:
+    resp = await server.post("/scripts/print_args.sh", data={"arg0": "foo"})
+    assert resp.status == 200
+    rs_id = await resp.text()
+    await running_ws_client.get_return_code(rs_id=rs_id)
+
+    # No directory for uploads should have been created
+    output_file = app["running_scripts"][rs_id].output_file
+    assert [p.name for p in output_file.parent.parent.iterdir()] == ["output"]
+
+
 async def test_run_script_with_absent_file(
     server: ClientSession,
     running_ws_client: RunningWSClient,
@@ -350,6 +568,8 @@ async def test_run_script_with_absent_file(
         ["arg0", "arg1", "arg3"],
         # Extras
         ["arg0", "arg1", "foobar"],
+        # Non-canonical numbering
+        ["arg0", "arg01"],
     ],
 )
 async def test_run_script_bad_arg_names(
@@ -361,6 +581,31 @@ async def test_run_script_bad_arg_names(
     assert resp.status == 400
 
 
+async def test_run_script_bad_args_cleanup(
+    server: ClientSession,
+    print_args_sh: None,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    temp_dir = tmp_path / "temp"
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp_dir))
+
+    with MultipartWriter("form-data") as mpwriter:
+        part = mpwriter.append(b"Hello, world!")
+        part.set_content_disposition(
+            "attachment",
+            name="not_an_arg",
+            filename="to_send.txt",
+        )
+
+    resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+    assert resp.status == 400
+
+    # Uploaded file should have been removed along with its directory
+    assert list(temp_dir.iterdir()) == []
+
+
 async def test_run_script_cleanup(
     aiohttp_client: Callable[[web.Application], Awaitable[ClientSession]],
     script_dir: Path,
@@ -375,15 +620,16 @@ async def test_run_script_cleanup(
         # Send a file
         file_to_send = tmp_path / "to_send.txt"
         file_to_send.write_text("Hello, world!")
-        with MultipartWriter("form-data") as mpwriter:
-            part = mpwriter.append(file_to_send.open("rb"))
-            part.set_content_disposition(
-                "attachment",
-                name="arg0",
-                filename="to_send.txt",
-            )
-
-        resp = await server.post("/scripts/print_args.sh", data=mpwriter)
+        with file_to_send.open("rb") as fh:
+            with MultipartWriter("form-data") as mpwriter:
+                part = mpwriter.append(fh)
+                part.set_content_disposition(
+                    "attachment",
+                    name="arg0",
+                    filename="to_send.txt",
+                )
+
+            resp = await server.post("/scripts/print_args.sh", data=mpwriter)
         assert resp.status == 200
         rs_id = await resp.text()
 
@@ -405,15 +651,12 @@ async def test_run_script_cleanup(
             running_ws_client.wait_for_running_change(old_rs_ids=[rs_id])
         )
 
-        # Wait for timeout
-        await asyncio.sleep(0.1)
+        # Wait for timeout, making sure wait_for_running_change unblocks
+        assert await wait_for_running_change_task == []
 
         # Should be gone from history
         with pytest.raises(RunningWSCommandError):
             await running_ws_client.get_return_code(rs_id=rs_id)
-        
-        # Make sure wait_for_running_change unblocks
-        assert await wait_for_running_change_task == []
 
         # Temporary file should also be gone
         assert not f.is_file()
@@ -502,8 +745,10 @@ async def test_enumerate_running(
     ]
 
     # Check on exit
-    assert await running_ws_client.get_return_code(rs_id=minimal_rs_id) == 0
-    assert await running_ws_client.get_return_code(rs_id=full_featured_rs_id) == 123
+    assert await asyncio.gather(
+        running_ws_client.get_return_code(rs_id=minimal_rs_id),
+        running_ws_client.get_return_code(rs_id=full_featured_rs_id),
+    ) == [0, 123]
 
     running = await (await server.get("/running/")).json()
     assert len(running) == 2
@@ -569,24 +814,28 @@ async def test_delete_script(
         """,
     )
 
-    rs_ids = []
-    for script in ["exit.sh", "sleep.sh"]:
-        # Send a file
-        file_to_send = tmp_path / "to_send.txt"
-        file_to_send.write_text("Hello, world!")
-        with MultipartWriter("form-data") as mpwriter:
-            part = mpwriter.append(file_to_send.open("rb"))
-            part.set_content_disposition(
-                "attachment",
-                name="arg0",
-                filename="to_send.txt",
-            )
+    file_to_send = tmp_path / "to_send.txt"
+    file_to_send.write_text("Hello, world!")
 
-        resp = await server.post(f"/scripts/{script}", data=mpwriter)
+    async def start(script: str) -> str:
+        # Send a file
+        with file_to_send.open("rb") as fh:
+            with MultipartWriter("form-data") as mpwriter:
+                part = mpwriter.append(fh)
+                part.set_content_disposition(
+                    "attachment",
+                    name="arg0",
+                    filename="to_send.txt",
+                )
+
+            resp = await server.post(f"/scripts/{script}", data=mpwriter)
         assert resp.status == 200
-        rs_ids.append((await resp.text()))
+        return await resp.text()
 
-    exit_rs_id, sleep_rs_id = rs_ids
+    exit_rs_id, sleep_rs_id = await asyncio.gather(
+        start("exit.sh"),
+        start("sleep.sh"),
+    )
 
     # Get temporary file names
     files = []
@@ -623,6 +872,25 @@ async def test_delete_script(
         assert not file.is_dir()
 
 
+@pytest.mark.parametrize(
+    "method, path",
+    [
+        ("GET", "/running/bad"),
+        ("DELETE", "/running/bad"),
+        ("GET", "/running/bad/output"),
+        ("GET", "/running/bad/events"),
+        ("POST", "/running/bad/kill"),
+    ],
+)
+async def test_unknown_running_script(
+    server: ClientSession,
+    method: str,
+    path: str,
+) -> None:
+    resp = await server.request(method, path)
+    assert resp.status == 404
+
+
 async def test_kill(
     server: ClientSession,
     running_ws_client: RunningWSClient,
@@ -656,9 +924,145 @@ async def test_kill(
     # Should have actually stopped during sleep
     resp = await server.get(f"/running/{rs_id}/output")
     assert resp.status == 200
+    assert resp.headers["Cache-Control"] == "no-cache"
     assert await resp.text() == "You should see this...\n"
 
 
+async def test_output_range(
+    server: ClientSession,
+    running_ws_client: RunningWSClient,
+    make_script: Callable[[str, str], None],
+) -> None:
+    make_script(
+        "test.sh",
+        """
+        #!/bin/sh
+        echo One
+        echo Two
+        """,
+    )
+
+    resp = await server.post("/scripts/test.sh")
+    assert resp.status == 200
+    rs_id = await resp.text()
+    assert await running_ws_client.get_return_code(rs_id=rs_id) == 0
+
+    resp = await server.get(f"/running/{rs_id}/output", headers={"Range": "bytes=4-"})
+    assert resp.status == 206
+    assert await resp.text() == "Two\n"
+
+
+async def test_events(
+    server: ClientSession,
+    running_ws_client: RunningWSClient,
+    make_script: Callable[[str, str], None],
+) -> None:
+    make_script(
+        "test.sh",
+        """
+        #!/bin/sh
+        echo "Starting..."
+        sleep 0.1
+        echo "## status: Half way"
+        echo "## progress: 1/2"
+        sleep 0.1
+        echo "Done!"
+        exit 12
+        """,
+    )
+
+    resp = await server.post("/scripts/test.sh")
+    assert resp.status == 200
+    rs_id = await resp.text()
+
+    # Make sure some output is already waiting when we subscribe
+    assert await running_ws_client.get_output(rs_id=rs_id, after=0) == "Starting...\n"
+
+    resp = await server.get(f"/running/{rs_id}/events")
+    assert resp.status == 200
+    assert resp.content_type == "text/event-stream"
+
+    # Stream ends when the script exits
+    events = []
+    for event_text in (await resp.text()).split("\n\n"):
+        if event_text:
+            event_line, data_line = event_text.split("\n")
+            assert event_line.startswith("event: ")
+            assert data_line.startswith("data: ")
+            events.append(
+                (
+                    event_line.removeprefix("event: "),
+                    json.loads(data_line.removeprefix("data: ")),
+                )
+            )
+
+    # Initial status and progress are always sent first
+    assert events[:2] == [("status", ""), ("progress", [0.0, 0.0])]
+
+    # Return code is sent last
+    assert events[-1] == ("return_code", 12)
+
+    assert "".join(value for event, value in events if event == "output") == (
+        "Starting...\n## status: Half way\n## progress: 1/2\nDone!\n"
+    )
+    assert [value for event, value in events if event == "status"] == ["", "Half way"]
+    assert [value for event, value in events if event == "progress"] == [
+        [0.0, 0.0],
+        [1.0, 2.0],
+    ]
+
+
+async def test_events_disconnect(
+    unused_tcp_port: int,
+    caplog: pytest.LogCaptureFixture,
+    script_dir: Path,
+    make_script: Callable[[str, str], None],
+) -> None:
+    make_script(
+        "sleep.sh",
+        """
+        #!/bin/sh
+        sleep 1000
+        """,
+    )
+
+    # NB: The aiohttp_client fixture's server cancels handlers when clients
+    # disconnect but, like web.run_app, an AppRunner (by default) does not.
+    app = make_app(script_dir, events_keepalive_interval=0.05)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", unused_tcp_port).start()
+    try:
+        async with ClientSession(f"http://127.0.0.1:{unused_tcp_port}") as server:
+            resp = await server.post("/scripts/sleep.sh")
+            assert resp.status == 200
+            rs_id = await resp.text()
+            rs = app["running_scripts"][rs_id]
+
+            for _ in range(3):
+                resp = await server.get(f"/running/{rs_id}/events")
+                assert resp.status == 200
+                assert (
+                    await resp.content.readuntil(b"\n\n")
+                    == b'event: status\ndata: ""\n\n'
+                )
+                resp.close()
+
+            # Once the keepalives notice the disconnections, only the server's
+            # own wait for the script to exit (before cleaning up) should be
+            # left waiting on the (silent) script
+            async def handlers_finished() -> None:
+                while len(rs._on_change) != 1:
+                    await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(handlers_finished(), timeout=1)
+
+            # Disconnection is normal and shouldn't be logged as an error
+            assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    finally:
+        await runner.cleanup()
+
+
 async def test_running_ws(
     server: ClientSession,
     running_ws_client: RunningWSClient,
@@ -701,7 +1105,10 @@ async def test_running_ws(
     task = asyncio.create_task(
         running_ws_client.get_output(rs_id=rs_id, after=len("Going to sleep...\n"))
     )
-    await asyncio.sleep(0.1)
+    # Let the task send the (blocking) get_output command first: once a later
+    # command has completed, the server must have received it
+    await asyncio.sleep(0)
+    await running_ws_client.get_status(rs_id=rs_id)
     task.cancel()
     with pytest.raises(asyncio.CancelledError):
         await task